@@ -1,5 +1,6 @@
 """Draw text."""
 
+from array import array
 from io import BytesIO
 from xml.etree import ElementTree
 
@@ -9,11 +10,19 @@ from ..images import RasterImage, SVGImage
 from ..matrix import Matrix
 from ..text.ffi import ffi, pango, units_from_double, units_to_double
 from ..text.fonts import get_hb_object_data
-from ..text.line_break import get_last_word_end
+from ..text.line_break import get_last_word_end, get_word_ends
 from .border import draw_line
 from .color import get_color
 from .stack import stacked
 
+GLYPH_INFO_SIZE = ffi.sizeof('PangoGlyphInfo')
+GLYPH_INFO_INTS = GLYPH_INFO_SIZE // ffi.sizeof('int')
+
+# Hex representations of all two- and four-digit glyph ids, so that emitting
+# a glyph is a plain indexed read instead of an f-string format.
+HEX2 = tuple(f'{value:02x}' for value in range(0x100))
+HEX4 = tuple(f'{value:04x}' for value in range(0x10000))
+
 
 def draw_text(stream, textbox, offset_x, text_overflow, block_ellipsis):
     """Draw a textbox to a pydyf stream."""
@@ -66,8 +75,8 @@ def draw_text(stream, textbox, offset_x, text_overflow, block_ellipsis):
 
 
 def draw_emojis(stream, font_size, x, y, emojis):
-    """Draw list of emojis."""
-    for image, font, a, d, e, f in emojis:
+    """Draw emojis stored in parallel lists."""
+    for image, font, a, d, e, f in zip(*emojis):
         with stacked(stream):
             stream.transform(a=a, d=d, e=x + e * font_size, f=y + f)
             image.draw(stream, font_size, font_size, None)
@@ -102,9 +111,10 @@ def draw_first_line(stream, textbox, text_overflow, block_ellipsis, matrix):
 
             # Remove last word if hyphenated.
             new_text = textbox.pango_layout.text
-            if new_text.endswith(textbox.style['hyphenate_character']):
+            hyphenate_character = textbox.style['hyphenate_character']
+            if new_text.endswith(hyphenate_character):
                 last_word_end = get_last_word_end(
-                    new_text[:-len(textbox.style['hyphenate_character'])],
+                    new_text[:-len(hyphenate_character)],
                     textbox.style['lang'])
                 if last_word_end:
                     new_text = new_text[:last_word_end]
@@ -113,24 +123,56 @@ def draw_first_line(stream, textbox, text_overflow, block_ellipsis, matrix):
 
     first_line, index = textbox.pango_layout.get_first_line()
 
-    if block_ellipsis != 'none':
-        while index:
-            last_word_end = get_last_word_end(
-                textbox.pango_layout.text[:-len(ellipsis)],
-                textbox.style['lang'])
-            if last_word_end is None:
-                break
-            new_text = textbox.pango_layout.text[:last_word_end]
-            textbox.pango_layout.set_text(new_text + ellipsis)
+    if block_ellipsis != 'none' and index:
+        # Binary search the longest prefix ending at a word boundary whose
+        # first line fits. Each probe costs a full Pango reshape, so the
+        # number of probes matters more than anything else here.
+        new_text = textbox.pango_layout.text[:-len(ellipsis)]
+        word_ends = get_word_ends(new_text, textbox.style['lang'])
+        if word_ends:
+            lo, hi = 0, len(word_ends)
+            while lo < hi:
+                middle = (lo + hi) // 2
+                textbox.pango_layout.set_text(
+                    new_text[:word_ends[middle]] + ellipsis)
+                first_line, index = textbox.pango_layout.get_first_line()
+                if index:
+                    hi = middle
+                else:
+                    lo = middle + 1
+            # Use the longest fitting prefix, or the shortest candidate when
+            # even that one overflows.
+            last_word_end = word_ends[lo - 1] if lo else word_ends[0]
+            textbox.pango_layout.set_text(
+                new_text[:last_word_end] + ellipsis)
             first_line, index = textbox.pango_layout.get_first_line()
 
-    utf8_text = textbox.pango_layout.text.encode()
+    text = textbox.pango_layout.text
+    if text.isascii():
+        # Byte offsets in UTF-8 are character offsets for ASCII-only text,
+        # don’t build the mapping at all.
+        utf8_to_char = None
+    else:
+        utf8_to_char = textbox.pango_layout.utf8_to_char
     previous_utf8_position = 0
     stream.set_text_matrix(*matrix.values)
+    # Pango units to 1000/em units conversion factor for logical widths.
+    kerning_scale = units_to_double(1000) / font_size
+    # Bind constants and attributes as locals, the glyph loop below is hot.
+    inverse_font_size = 1 / font_size
+    empty_glyph = pango.PANGO_GLYPH_EMPTY
+    unknown_glyph_flag = pango.PANGO_GLYPH_UNKNOWN_FLAG
     last_font = None
-    string = ''
+    parts = []
+    # Whether the last fragment is a ‘<’ opening an empty glyph batch. The
+    # trailing ‘<’ is always its own fragment, so closing an empty batch is a
+    # single pop.
+    bracket_open = False
     x_advance = 0
-    emojis = []
+    # Parallel lists describing the emojis of the line: image, font and the
+    # transform matrix values.
+    emojis = (images, emoji_fonts, x_scales, y_scales, x_offsets,
+              y_offsets) = ([], [], [], [], [], [])
     run = first_line.runs[0]
     while run != ffi.NULL:
         # Get Pango objects.
@@ -139,119 +181,195 @@ def draw_first_line(stream, textbox, text_overflow, block_ellipsis, matrix):
         glyph_string = glyph_item.glyphs
         glyphs = glyph_string.glyphs
         num_glyphs = glyph_string.num_glyphs
-        offset = glyph_item.item.offset
+        cluster_offset = glyph_item.item.offset
+        item_length = glyph_item.item.length
         clusters = glyph_string.log_clusters
 
+        # Snapshot the glyph records and cluster offsets as native ints,
+        # cffi marshals each struct field access otherwise.
+        glyph_values = array('i')
+        glyph_values.frombytes(
+            ffi.buffer(glyphs, num_glyphs * GLYPH_INFO_SIZE))
+        cluster_values = ffi.unpack(clusters, num_glyphs)
+
         # Add font file content.
         pango_font = glyph_item.item.analysis.font
         font = stream.add_font(pango_font)
+        font_widths = font.widths
+        font_cmap = font.cmap
+        font_bitmap = font.bitmap
+        font_vertical_offsets = font.vertical_offsets
 
-        # Get positions of the glyphs in the UTF-8 string.
-        utf8_positions = [offset + clusters[i] for i in range(1, num_glyphs)]
-        utf8_positions.append(offset + glyph_item.item.length)
-
-        # Go through the run glyphs.
+        # Go through the run glyphs. Runs sharing the same font accumulate
+        # into the same glyph batch and are flushed together.
         if font != last_font:
-            if string:
-                stream.show_text(string)
-            string = ''
+            if parts:
+                if bracket_open:
+                    parts.pop()
+                    bracket_open = False
+                else:
+                    parts.append('>')
+                stream.show_text(''.join(parts))
+                parts = []
             stream.set_font_size(font.hash, 1 if font.bitmap else font_size)
             last_font = font
-        string += '<'
+            parts.append('<')
+            bracket_open = True
         for i in range(num_glyphs):
-            glyph_info = glyphs[i]
-            glyph = glyph_info.glyph
-            width = glyph_info.geometry.width
-            if (glyph == pango.PANGO_GLYPH_EMPTY or
-                    glyph & pango.PANGO_GLYPH_UNKNOWN_FLAG):
-                string += f'>{-width / font_size}<'
+            base = i * GLYPH_INFO_INTS
+            glyph = glyph_values[base]
+            width = glyph_values[base + 1]
+            if glyph == empty_glyph or glyph & unknown_glyph_flag:
+                parts.append(f'>{-width * inverse_font_size}')
+                parts.append('<')
+                bracket_open = True
                 continue
-            utf8_position = utf8_positions[i]
+            # Get the position of the next cluster in the UTF-8 string.
+            if i + 1 < num_glyphs:
+                utf8_position = cluster_offset + cluster_values[i + 1]
+            else:
+                utf8_position = cluster_offset + item_length
+
+            offset = glyph_values[base + 2] * inverse_font_size
+            rise = glyph_values[base + 3] / 1000
+
+            if font_bitmap:
+                hex_glyph = HEX2[glyph] if glyph < 0x100 else f'{glyph:02x}'
+            elif glyph < 0x10000:
+                hex_glyph = HEX4[glyph]
+            else:
+                # Glyph ids out of the table, mostly broken fonts.
+                hex_glyph = f'{glyph:04x}'
 
-            offset = glyph_info.geometry.x_offset / font_size
-            rise = glyph_info.geometry.y_offset / 1000
             if rise:
-                if string[-1] == '<':
-                    string = string[:-1]
+                if bracket_open:
+                    parts.pop()
+                    bracket_open = False
                 else:
-                    string += '>'
-                stream.show_text(string)
+                    parts.append('>')
+                stream.show_text(''.join(parts))
                 stream.set_text_rise(-rise)
-                string = ''
+                parts = []
                 if offset:
-                    string = f'{-offset}'
-                string += f'<{glyph:02x}>' if font.bitmap else f'<{glyph:04x}>'
-                stream.show_text(string)
+                    parts.append(f'{-offset}')
+                parts.append(f'<{hex_glyph}>')
+                stream.show_text(''.join(parts))
                 stream.set_text_rise(0)
-                string = '<'
+                parts = ['<']
+                bracket_open = True
             else:
                 if offset:
-                    string += f'>{-offset}<'
-                string += f'{glyph:02x}' if font.bitmap else f'{glyph:04x}'
-
-            # Get ink bounding box and logical widths in font.
-            if glyph not in font.widths:
+                    parts.append(f'>{-offset}')
+                    parts.append('<')
+                parts.append(hex_glyph)
+                bracket_open = False
+
+            # Get ink bounding box and logical widths in font. Store all
+            # extent-derived values at once, so that extents are only fetched
+            # once per glyph and per font.
+            glyph_width = font_widths.get(glyph)
+            if glyph_width is None:
                 pango.pango_font_get_glyph_extents(
                     pango_font, glyph, stream.ink_rect, stream.logical_rect)
-                font.widths[glyph] = int(round(
+                font_widths[glyph] = glyph_width = int(round(
                     units_to_double(stream.logical_rect.width * 1000) /
                     font_size))
+                # Normalize by the font size like the widths above, Font
+                # objects are shared between font sizes.
+                font_vertical_offsets[glyph] = units_to_double(
+                    -stream.logical_rect.y -
+                    stream.logical_rect.height) / font_size
 
             # Set kerning, word spacing, letter spacing.
-            kerning = int(
-                font.widths[glyph] - units_to_double(width * 1000) / font_size + offset)
+            kerning = int(glyph_width - width * kerning_scale + offset)
             if kerning:
-                string += f'>{kerning}<'
+                parts.append(f'>{kerning}')
+                parts.append('<')
+                bracket_open = True
 
             # Create mapping between glyphs and characters.
-            if glyph not in font.cmap:
-                utf8_slice = slice(previous_utf8_position, utf8_position)
-                font.cmap[glyph] = utf8_text[utf8_slice].decode()
+            if glyph not in font_cmap:
+                if utf8_to_char is None:
+                    font_cmap[glyph] = text[
+                        previous_utf8_position:utf8_position]
+                else:
+                    font_cmap[glyph] = text[
+                        utf8_to_char[previous_utf8_position]:
+                        utf8_to_char[utf8_position]]
             previous_utf8_position = utf8_position
 
             # Create list of emojis.
             if font.svg:
-                svg_data = get_hb_object_data(font.hb_face, 'svg', glyph)
-                if svg_data:
-                    # Do as explained in specification
-                    # https://learn.microsoft.com/typography/opentype/spec/svg
-                    tree = ElementTree.fromstring(svg_data)
-                    defs = ElementTree.Element('defs')
-                    for child in list(tree):
-                        defs.append(child)
-                        tree.remove(child)
-                    tree.append(defs)
-                    ElementTree.SubElement(
-                        tree, 'use', attrib={'href': f'#glyph{glyph}'})
-                    image = SVGImage(tree, None, None, stream)
-                    a = d = font.widths[glyph] / 1000 / font.upem * font_size
-                    emojis.append([image, font, a, d, x_advance, 0])
+                # The rewritten tree only depends on the glyph, parse the SVG
+                # data once per glyph and per font.
+                if glyph in font.svg_images:
+                    image = font.svg_images[glyph]
+                else:
+                    image = None
+                    svg_data = get_hb_object_data(font.hb_face, 'svg', glyph)
+                    if svg_data:
+                        # Do as explained in specification
+                        # https://learn.microsoft.com/typography/opentype/spec/svg
+                        tree = ElementTree.fromstring(svg_data)
+                        defs = ElementTree.Element('defs')
+                        for child in list(tree):
+                            defs.append(child)
+                            tree.remove(child)
+                        tree.append(defs)
+                        ElementTree.SubElement(
+                            tree, 'use', attrib={'href': f'#glyph{glyph}'})
+                        image = SVGImage(tree, None, None, stream)
+                    font.svg_images[glyph] = image
+                if image is not None:
+                    scale = glyph_width / 1000 / font.upem * font_size
+                    images.append(image)
+                    emoji_fonts.append(font)
+                    x_scales.append(scale)
+                    y_scales.append(scale)
+                    x_offsets.append(x_advance)
+                    y_offsets.append(0)
             elif font.png:
-                png_data = get_hb_object_data(font.hb_font, 'png', glyph)
-                if png_data:
-                    pillow_image = Image.open(BytesIO(png_data))
-                    image_id = f'{font.hash}{glyph}'
-                    image = RasterImage(pillow_image, image_id, png_data)
-                    d = font.widths[glyph] / 1000
-                    a = pillow_image.width / pillow_image.height * d
-                    pango.pango_font_get_glyph_extents(
-                        pango_font, glyph, stream.ink_rect,
-                        stream.logical_rect)
-                    f = units_to_double(
-                        (-stream.logical_rect.y - stream.logical_rect.height))
-                    f = f / font_size - font_size
-                    emojis.append([image, font, a, d, x_advance, f])
-
-            x_advance += (font.widths[glyph] + offset - kerning) / 1000
-
-        # Close the last glyphs list, remove if empty.
-        if string[-1] == '<':
-            string = string[:-1]
+                # The decoded image, scales and normalized vertical offset
+                # only depend on the glyph, decode the PNG data once per glyph
+                # and per font. The image id is stable across draws so that
+                # images are deduplicated in the PDF.
+                if glyph in font.png_images:
+                    png_image = font.png_images[glyph]
+                else:
+                    png_image = None
+                    png_data = get_hb_object_data(font.hb_font, 'png', glyph)
+                    if png_data:
+                        pillow_image = Image.open(BytesIO(png_data))
+                        image_id = f'{font.hash}{glyph}'
+                        image = RasterImage(pillow_image, image_id, png_data)
+                        d = glyph_width / 1000
+                        a = pillow_image.width / pillow_image.height * d
+                        # The size-normalized offset was stored when the
+                        # glyph extents were fetched for the widths above, so
+                        # the cached tuple is valid for all font sizes.
+                        vertical_offset = font_vertical_offsets[glyph]
+                        png_image = (image, a, d, vertical_offset)
+                    font.png_images[glyph] = png_image
+                if png_image is not None:
+                    image, a, d, vertical_offset = png_image
+                    images.append(image)
+                    emoji_fonts.append(font)
+                    x_scales.append(a)
+                    y_scales.append(d)
+                    x_offsets.append(x_advance)
+                    y_offsets.append(vertical_offset - font_size)
+
+            x_advance += (glyph_width + offset - kerning) / 1000
+
+    # Close the last glyphs list, remove if empty.
+    if parts:
+        if bracket_open:
+            parts.pop()
         else:
-            string += '>'
+            parts.append('>')
 
     # Draw text.
-    stream.show_text(string)
+    stream.show_text(''.join(parts))
 
     return emojis
 
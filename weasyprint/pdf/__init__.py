@@ -1,5 +1,6 @@
 """PDF generation management."""
 
+from functools import cache
 from importlib.resources import files
 
 import pydyf
@@ -21,6 +22,12 @@ VARIANTS = {
     for (name, data) in variants.items()}
 
 
+@cache
+def _srgb_profile():
+    """Get the sRGB ICC profile, read once per process."""
+    return (files(__package__) / 'sRGB2014.icc').read_bytes()
+
+
 def _w3c_date_to_pdf(string, attr_name):
     """Tranform W3C date to PDF format."""
     if string is None:
@@ -302,7 +309,7 @@ def generate_pdf(document, target, zoom, **options):
     if srgb:
         # Add ICC profile.
         profile = pydyf.Stream(
-            [(files(__package__) / 'sRGB2014.icc').read_bytes()],
+            [_srgb_profile()],
             pydyf.Dictionary({'N': 3, 'Alternate': '/DeviceRGB'}),
             compress=compress)
         pdf.add_object(profile)
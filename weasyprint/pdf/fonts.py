@@ -97,6 +97,9 @@ class Font:
         self.stemh = 80
         self.widths = {}
         self.cmap = {}
+        self.vertical_offsets = {}
+        self.svg_images = {}
+        self.png_images = {}
         self.used_in_forms = False
 
         # Set font flags.
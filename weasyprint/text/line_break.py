@@ -150,6 +150,7 @@ class Layout:
             # Keep only the first line plus one character, we don't need more
             text = text[:index+2]
         self.text = text
+        self._utf8_text = self._utf8_to_char = None
         text, bytestring = unicode_to_char_p(text)
         pango.pango_layout_set_text(self.layout, text, -1)
 
@@ -210,6 +211,35 @@ class Layout:
         if b'\t' in bytestring:
             self.set_tabs()
 
+    @property
+    def utf8_text(self):
+        """UTF-8 encoded version of ``text``, cached until next ``set_text``."""
+        if self._utf8_text is None:
+            self._utf8_text = self.text.encode()
+        return self._utf8_text
+
+    @property
+    def utf8_to_char(self):
+        """List mapping byte offsets in ``utf8_text`` to character indexes.
+
+        The list has one extra entry so that the offset just past the end of
+        the text is a valid index, making it safe to slice ``text`` with any
+        pair of cluster byte offsets.
+
+        """
+        if self._utf8_to_char is None:
+            utf8_text = self.utf8_text
+            table = [0] * (len(utf8_text) + 1)
+            index = 0
+            for position, byte in enumerate(utf8_text):
+                table[position] = index
+                if byte & 0xC0 != 0x80:
+                    # Not a UTF-8 continuation byte, a new character starts.
+                    index += 1
+            table[len(utf8_text)] = index
+            self._utf8_to_char = table
+        return self._utf8_to_char
+
     def set_tabs(self):
         if isinstance(self.style['tab_size'], int):
             layout = Layout(
@@ -542,3 +572,12 @@ def get_last_word_end(text, lang):
     for i, attr in enumerate(list(log_attrs)[::-1]):
         if i and attr.is_word_end:
             return len(text) - i
+
+
+def get_word_ends(text, lang):
+    if not text or len(text) < 2:
+        return []
+    bytestring, log_attrs = get_log_attrs(text, lang)
+    return [
+        position for position in range(len(text))
+        if log_attrs[position].is_word_end]